@@ -6,99 +6,349 @@ This script monitors CPU energy consumption using Intel's Running Average Power
 interface at high frequency. Optimized for capturing rapid changes in power usage.
 
 Requirements:
-- Python 3.6+
+- Python 3.7+
 - Root privileges (or appropriate permissions to access RAPL sysfs files)
 - Linux system with Intel CPU supporting RAPL
+- numpy (numba optional, to compile the power computation)
+- Optional: the _rapl_fast C extension (python setup.py build_ext --inplace)
+- Linux timerfd support (used to pace sampling)
+- For --backend perf: x86 Linux kernel exposing the perf "power" PMU
 """
 
 import os
 import time
 import datetime
 import argparse
-import csv
-from pathlib import Path
+import ctypes
+import platform
+import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from sampling import U64, IntervalTimer, PollTimer, configure_sampler_scheduling
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import _rapl_fast
+    RAPL_FAST_AVAILABLE = True
+except ImportError:
+    RAPL_FAST_AVAILABLE = False
 
 # RAPL sysfs path
 RAPL_PATH = "/sys/class/powercap/intel-rapl"
 
+# perf "power" PMU exposing RAPL counting events
+PERF_POWER_PATH = "/sys/bus/event_source/devices/power"
+
+# perf_event_open(2) syscall numbers (RAPL is only exposed on x86)
+SYS_PERF_EVENT_OPEN = {"x86_64": 298, "i386": 336, "i686": 336}
+
+# Above this many domains, sysfs reads are spread over a persistent thread pool
+PARALLEL_READ_THRESHOLD = 4
+
+# RAPL perf event -> suffix matching the powercap domain naming
+PERF_EVENT_SUFFIXES = {
+    "energy-pkg": "",
+    "energy-cores": "-core",
+    "energy-gpu": "-uncore",
+    "energy-ram": "-dram",
+}
+
+class PerfEventAttr(ctypes.Structure):
+    """perf_event_attr, truncated to PERF_ATTR_SIZE_VER0 (64 bytes)."""
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("size", ctypes.c_uint32),
+        ("config", ctypes.c_uint64),
+        ("sample_period", ctypes.c_uint64),
+        ("sample_type", ctypes.c_uint64),
+        ("read_format", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("wakeup_events", ctypes.c_uint32),
+        ("bp_type", ctypes.c_uint32),
+        ("config1", ctypes.c_uint64),
+    ]
+
 class RaplReader:
     """Fast reader for RAPL energy values."""
     
     def __init__(self, domain_paths):
         """Initialize with paths to monitor."""
         self.domain_paths = domain_paths
-        self.energy_paths = {domain: os.path.join(path, "energy_uj") 
-                             for domain, path in domain_paths.items()}
         self.max_energy_paths = {domain: os.path.join(path, "max_energy_range_uj") 
                                 for domain, path in domain_paths.items()}
         
+        # Keep energy_uj files open so each sample is a single pread()
+        self.pool = None
+        self.energy_fds = {}
+        self.fd_array = np.empty(0, dtype=np.intc)
+        try:
+            for domain, path in domain_paths.items():
+                self.energy_fds[domain] = os.open(os.path.join(path, "energy_uj"), os.O_RDONLY)
+        except OSError:
+            self.close()
+            raise
+        
+        self.fd_array = np.array(list(self.energy_fds.values()), dtype=np.intc)
+        
+        # Slow sysfs reads only pay off in parallel on many-domain systems
+        if len(domain_paths) > PARALLEL_READ_THRESHOLD:
+            self.pool = ThreadPoolExecutor(max_workers=len(domain_paths))
+            # Start every worker now, before the sampling thread is pinned or made real-time,
+            # since threads created later would inherit its affinity and scheduling policy
+            barrier = threading.Barrier(len(domain_paths))
+            for future in [self.pool.submit(barrier.wait) for _ in domain_paths]:
+                future.result()
+        
         # Cache max energy values
         self.max_energy_values = {}
         for domain, path in self.max_energy_paths.items():
             try:
-                with open(path, 'r') as f:
-                    self.max_energy_values[domain] = int(f.read().strip())
+                with open(path, 'rb') as f:
+                    self.max_energy_values[domain] = int(f.read())
             except (IOError, OSError) as e:
                 print(f"Warning: Couldn't read max energy for {domain}: {e}")
                 self.max_energy_values[domain] = 2**32  # Fallback value
     
+    @staticmethod
+    def _read_fd(fd):
+        try:
+            # int() parses the raw bytes directly and ignores the trailing newline
+            return int(os.pread(fd, 32, 0))
+        except (OSError, ValueError):
+            return None
+    
     def read_energy_values(self):
-        """Read energy values for all domains in parallel."""
-        result = {}
+        """Read energy values for all domains from cached fds."""
+        if self.pool is not None:
+            return dict(zip(self.energy_fds, self.pool.map(self._read_fd, self.energy_fds.values())))
         
-        def read_domain(domain):
+        return {domain: self._read_fd(fd) for domain, fd in self.energy_fds.items()}
+    
+    def read_energy_into(self, out):
+        """Store energy values for all domains into `out` in domain order, NaN if unreadable."""
+        if RAPL_FAST_AVAILABLE and self.pool is None:
+            _rapl_fast.read_all(self.fd_array, out)
+            return
+        for j, energy in enumerate(self.read_energy_values().values()):
+            out[j] = np.nan if energy is None else energy
+    
+    def close(self):
+        """Shut down the read pool and close all cached energy file descriptors."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        fds, self.energy_fds = self.energy_fds, {}
+        # Closed fd numbers may be reused, so the C fast path must not see them again
+        self.fd_array = np.empty(0, dtype=np.intc)
+        for fd in fds.values():
             try:
-                with open(self.energy_paths[domain], 'r') as f:
-                    result[domain] = int(f.read().strip())
-            except (IOError, OSError) as e:
-                result[domain] = None
+                os.close(fd)
+            except OSError:
+                pass
+    
+    def __del__(self):
+        self.close()
+    
+    def get_max_energy(self, domain):
+        """Get max energy value for a domain."""
+        return self.max_energy_values.get(domain)
+
+class PerfRaplReader:
+    """Reader for RAPL energy counters through perf_event_open(2).
+    
+    Each counter is read as a binary u64 that the kernel keeps accumulated,
+    so no text parsing or wraparound handling is needed.
+    """
+    
+    def __init__(self, domain_events):
+        """Initialize with a mapping of domain -> (perf event name, cpu)."""
+        self.energy_fds = {}
+        self.domain_events = domain_events
         
-        # Use threads for faster parallel reads
-        threads = []
-        for domain in self.domain_paths:
-            thread = threading.Thread(target=read_domain, args=(domain,))
-            threads.append(thread)
-            thread.start()
+        with open(os.path.join(PERF_POWER_PATH, "type"), 'r') as f:
+            pmu_type = int(f.read().strip())
         
-        # Wait for all threads to finish
-        for thread in threads:
-            thread.join()
-            
+        nr = SYS_PERF_EVENT_OPEN.get(platform.machine())
+        if nr is None:
+            raise Exception(f"perf_event_open is not supported on {platform.machine()}.")
+        libc = ctypes.CDLL(None, use_errno=True)
+        
+        # Counter scale converted from Joules to microjoules, matching RaplReader
+        self.scales = {}
+        # One preallocated buffer per counter, filled in place on every read
+        self.bufs = {domain: bytearray(U64.size) for domain in domain_events}
+        try:
+            for domain, (event, cpu) in domain_events.items():
+                config, scale = read_perf_event(event)
+                self.scales[domain] = scale * 1000000
+                
+                attr = PerfEventAttr()
+                attr.type = pmu_type
+                attr.size = ctypes.sizeof(PerfEventAttr)
+                attr.config = config
+                fd = libc.syscall(ctypes.c_long(nr), ctypes.byref(attr), ctypes.c_int(-1),
+                                  ctypes.c_int(cpu), ctypes.c_int(-1), ctypes.c_ulong(0))
+                if fd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, f"perf_event_open failed for power/{event}/ on CPU {cpu}: "
+                                         f"{os.strerror(errno)}")
+                self.energy_fds[domain] = fd
+        except Exception:
+            self.close()
+            raise
+    
+    def read_energy_values(self):
+        """Read energy values (microjoules) for all domains."""
+        result = {}
+        for domain, fd in self.energy_fds.items():
+            buf = self.bufs[domain]
+            try:
+                if os.readv(fd, (buf,)) == U64.size:
+                    result[domain] = U64.unpack_from(buf)[0] * self.scales[domain]
+                else:
+                    result[domain] = None
+            except OSError:
+                result[domain] = None
         return result
     
+    def read_energy_into(self, out):
+        """Store energy values for all domains into `out` in domain order, NaN if unreadable."""
+        for j, energy in enumerate(self.read_energy_values().values()):
+            out[j] = np.nan if energy is None else energy
+    
     def get_max_energy(self, domain):
-        """Get max energy value for a domain."""
-        return self.max_energy_values.get(domain)
+        """Get max energy value for a domain (full range of the 64-bit counter)."""
+        return 2**64 * self.scales[domain]
+    
+    def close(self):
+        """Close all perf event file descriptors."""
+        fds, self.energy_fds = self.energy_fds, {}
+        for fd in fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+    
+    def __del__(self):
+        self.close()
+
+def read_perf_event(event):
+    """Read the config value and scale (Joules per count) of a perf power event."""
+    events_path = os.path.join(PERF_POWER_PATH, "events")
+    
+    config = None
+    with open(os.path.join(events_path, event), 'r') as f:
+        for term in f.read().strip().split(','):
+            key, _, value = term.partition('=')
+            if key == "event":
+                config = int(value, 0)
+    if config is None:
+        raise Exception(f"Couldn't parse perf event power/{event}/")
+    
+    with open(os.path.join(events_path, f"{event}.scale"), 'r') as f:
+        scale = float(f.read().strip())
+    
+    return config, scale
+
+def parse_cpu_list(cpu_list):
+    """Parse a kernel CPU list such as '0,24' or '0-3'."""
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def get_available_perf_domains():
+    """Get all RAPL domains exposed by the perf power PMU, one per event and socket."""
+    domains = {}
+    events_path = os.path.join(PERF_POWER_PATH, "events")
+    
+    if not os.path.exists(events_path):
+        raise Exception("perf power PMU not found. Ensure your kernel exposes RAPL through perf events.")
+    
+    # The PMU cpumask lists one CPU per package
+    with open(os.path.join(PERF_POWER_PATH, "cpumask"), 'r') as f:
+        cpus = parse_cpu_list(f.read())
+    
+    events = sorted(e for e in os.listdir(events_path) if e.startswith("energy-") and '.' not in e)
+    for socket, cpu in enumerate(cpus):
+        for event in events:
+            if event in PERF_EVENT_SUFFIXES:
+                domains[f"package-{socket}{PERF_EVENT_SUFFIXES[event]}"] = (event, cpu)
+            elif socket == 0:
+                # Platform-wide domains such as psys are only counted once
+                domains[event[len("energy-"):]] = (event, cpu)
+    
+    return domains
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def compute_power(energy, elapsed, prev_energy, prev_elapsed, max_range, out):
+        """Compute power (W) from raw energy readings (uJ) taken at elapsed times (s).
+        
+        prev_energy/prev_elapsed are the reading preceding the first row. Counter
+        wraparound is corrected branchlessly; NaN readings yield NaN power.
+        """
+        n, k = energy.shape
+        for i in range(n):
+            dt = elapsed[i] - prev_elapsed
+            for j in range(k):
+                d = energy[i, j] - prev_energy[j]
+                d += (d < 0) * max_range[j]
+                out[i, j] = d * 1e-6 / dt
+            prev_energy = energy[i]
+            prev_elapsed = elapsed[i]
+else:
+    def compute_power(energy, elapsed, prev_energy, prev_elapsed, max_range, out):
+        """Vectorized NumPy version of the power kernel, used when numba is not installed.
+        
+        A per-element Python loop would hold the GIL on the writer thread long
+        enough to stall the sampler at every flush.
+        """
+        d = np.diff(energy, axis=0, prepend=prev_energy[np.newaxis])
+        d += (d < 0) * max_range
+        dt = np.diff(elapsed, prepend=prev_elapsed)
+        np.divide(d * 1e-6, dt[:, np.newaxis], out=out)
+
+def read_domain_name(domain_path):
+    """Read the name of a RAPL domain."""
+    with open(domain_path + "/name", 'rb') as f:
+        return f.read().rstrip().decode()
 
 def get_available_domains():
     """Get all available RAPL domains on the system."""
     domains = {}
     
-    if not os.path.exists(RAPL_PATH):
+    try:
+        rapl_dir = os.scandir(RAPL_PATH)
+    except FileNotFoundError:
         raise Exception("RAPL sysfs interface not found. Ensure your CPU supports RAPL and it's enabled.")
     
-    # Find all intel-rapl domains
-    for domain in os.listdir(RAPL_PATH):
-        if domain.startswith("intel-rapl:"):
-            domain_path = os.path.join(RAPL_PATH, domain)
-            
-            # Get domain name
-            with open(os.path.join(domain_path, "name"), 'r') as f:
-                name = f.read().strip()
-            
-            domains[name] = domain_path
-            
-            # Check for subdomains
-            for subdomain in os.listdir(domain_path):
-                if subdomain.startswith("intel-rapl:"):
-                    subdomain_path = os.path.join(domain_path, subdomain)
-                    
-                    # Get subdomain name
-                    with open(os.path.join(subdomain_path, "name"), 'r') as f:
-                        subname = f.read().strip()
-                    
-                    domains[f"{name}-{subname}"] = subdomain_path
+    # Find all intel-rapl domains in a single pass per directory
+    with rapl_dir:
+        for domain in rapl_dir:
+            if domain.name.startswith("intel-rapl:"):
+                name = read_domain_name(domain.path)
+                domains[name] = domain.path
+                
+                # Check for subdomains
+                with os.scandir(domain.path) as subdomains:
+                    for subdomain in subdomains:
+                        if subdomain.name.startswith("intel-rapl:"):
+                            subname = read_domain_name(subdomain.path)
+                            domains[f"{name}-{subname}"] = subdomain.path
     
     return domains
 
@@ -114,6 +364,14 @@ def main():
                         help="Buffer size before writing to disk (default: 1000 samples)")
     parser.add_argument("--domains", type=str,
                         help="Comma-separated list of specific RAPL domains to monitor (default: all)")
+    parser.add_argument("--backend", choices=["sysfs", "perf"], default="sysfs",
+                        help="RAPL access method: powercap sysfs or perf_event_open (default: sysfs)")
+    parser.add_argument("--poll", action="store_true",
+                        help="Busy-wait between samples for sub-millisecond precision (uses 100%% of one CPU core)")
+    parser.add_argument("--cpu", type=int,
+                        help="Pin the sampling thread to this CPU")
+    parser.add_argument("--rt-prio", type=int,
+                        help="Run the sampling thread under SCHED_FIFO at this priority (1-99) and lock memory")
     args = parser.parse_args()
     
     # Warn if interval is very small
@@ -121,9 +379,16 @@ def main():
         print("Warning: Sampling interval is extremely small. This may impact system performance.")
         print("The actual interval may be limited by hardware and kernel capabilities.")
     
+    if args.poll:
+        print("Warning: --poll busy-waits between samples and keeps one CPU core at 100% utilization.")
+        print("Consider combining it with --cpu to dedicate a core to sampling.")
+    
     try:
         # Get available domains
-        all_domains = get_available_domains()
+        if args.backend == "perf":
+            all_domains = get_available_perf_domains()
+        else:
+            all_domains = get_available_domains()
         
         if not all_domains:
             raise Exception("No RAPL domains found on this system.")
@@ -140,112 +405,174 @@ def main():
             domains = all_domains
         
         print(f"Found {len(domains)} RAPL domains:")
-        for domain, path in domains.items():
-            print(f"  - {domain} ({path})")
+        for domain, source in domains.items():
+            if args.backend == "perf":
+                source = f"power/{source[0]}/ on CPU {source[1]}"
+            print(f"  - {domain} ({source})")
         
         # Initialize RAPL reader
-        rapl_reader = RaplReader(domains)
-        
-        # Initialize energy readings
-        prev_energy = rapl_reader.read_energy_values()
+        if args.backend == "perf":
+            rapl_reader = PerfRaplReader(domains)
+        else:
+            rapl_reader = RaplReader(domains)
         
         # Create output file and write header
-        with open(args.output, 'w', newline='') as csvfile:
-            fieldnames = ['timestamp', 'elapsed_seconds'] + [f"{domain}_power_watts" for domain in domains]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+        with open(args.output, 'wb') as csvfile:
+            domain_names = list(domains)
+            fieldnames = ['timestamp', 'elapsed_seconds'] + [f"{domain}_power_watts" for domain in domain_names]
+            csvfile.write((','.join(fieldnames) + '\r\n').encode())
+            
+            # Rows are formatted straight to bytes, keeping the csv module's CRLF line endings
+            row_format = b"%s,%.6f" + b",%.3f" * len(domain_names) + b"\r\n"
+            
+            # Columnar buffers of raw energy readings to reduce disk I/O; missing readings are NaN.
+            # A buffer size below 1 flushes every sample, as before.
+            buffer_rows = max(1, args.buffer_size)
+            
+            def new_buffers():
+                return (np.empty(buffer_rows, dtype=np.float64),
+                        np.empty((buffer_rows, len(domain_names)), dtype=np.float64))
             
-            # Create buffer for samples to reduce disk I/O
-            buffer = []
+            elapsed_col, energy_cols = new_buffers()
+            idx = 0
+            
+            max_range = np.array([rapl_reader.get_max_energy(domain) for domain in domain_names],
+                                 dtype=np.float64)
+            
+            # Compile the power kernel up front, not on the writer thread at the first flush
+            warmup = np.zeros((1, len(domain_names)), dtype=np.float64)
+            compute_power(warmup, np.ones(1), warmup[0], 0.0, max_range, np.empty_like(warmup))
+            
+            # Full buffers are converted to power and written by a background thread,
+            # off the sampling path
+            writer_q = queue.SimpleQueue()
+            writer_errors = []
+            
+            def check_writer():
+                """Abort monitoring if the writer thread has stopped."""
+                if not writer_thread.is_alive():
+                    reason = writer_errors[0] if writer_errors else "unknown error"
+                    raise Exception(f"CSV writer thread stopped ({reason}); aborting monitoring.")
+            
+            def drain():
+                rows_written = 0
+                last_status_elapsed = 0.0
+                try:
+                    # The first item is the priming reading that precedes the first sample
+                    first = writer_q.get()
+                    if first is None:
+                        return
+                    prev_elapsed, prev_energy = first
+                    
+                    while True:
+                        batch = writer_q.get()
+                        if batch is None:
+                            break
+                        elapsed, energy = batch
+                        power = np.empty_like(energy)
+                        compute_power(energy, elapsed, prev_energy, prev_elapsed, max_range, power)
+                        prev_energy, prev_elapsed = energy[-1], elapsed[-1]
+                        
+                        # Derive wall-clock timestamps from the monotonic offsets in one pass
+                        ts = np.datetime64(anchor_dt, 'us') + (elapsed * 1e6).astype('timedelta64[us]')
+                        ts_bytes = np.datetime_as_string(ts, unit='us').astype('S').tolist()
+                        
+                        buf = bytearray()
+                        for t, e, p in zip(ts_bytes, elapsed.tolist(), power.tolist()):
+                            buf += row_format % (t, e, *p)
+                        # Missing readings are written as empty fields
+                        csvfile.write(buf.replace(b",nan", b","))
+                        csvfile.flush()
+                        rows_written += len(elapsed)
+                        
+                        # Print status update
+                        if prev_elapsed - last_status_elapsed >= 5:  # Status update every 5 seconds
+                            rate = rows_written / prev_elapsed
+                            total_power = np.nansum(power[-1])
+                            print(f"[{ts_bytes[-1].decode()}] Collected {rows_written} samples ({rate:.2f} samples/sec), "
+                                  f"Total CPU Power: {round(total_power, 2)}W")
+                            last_status_elapsed = prev_elapsed
+                except Exception as e:
+                    # Reported by the sampling loop, which then stops the run
+                    writer_errors.append(e)
+            
+            start_time = time.monotonic()
+            anchor_dt = datetime.datetime.now()
+            
+            writer_thread = threading.Thread(target=drain, daemon=True)
+            writer_thread.start()
             
-            start_time = time.time()
             print(f"Starting high-frequency CPU energy monitoring at {args.interval}s intervals...")
             print(f"Data will be saved to {args.output}")
             print("Press Ctrl+C to stop monitoring")
             
+            # Applies to this (sampling) thread only; the writer thread keeps default scheduling
+            configure_sampler_scheduling(args.cpu, args.rt_prio)
+            
+            timer = PollTimer(args.interval) if args.poll else IntervalTimer(args.interval)
             try:
                 samples = 0
-                last_status_time = start_time
+                missed_ticks = 0
+                
+                # Priming reading taken as the timer is armed, so every dt spans one interval
+                prime_elapsed = time.monotonic() - start_time
+                prime_energy = np.empty(len(domain_names), dtype=np.float64)
+                rapl_reader.read_energy_into(prime_energy)
+                writer_q.put((prime_elapsed, prime_energy))
                 
                 while True:
-                    sample_start = time.time()
+                    # Block until the next tick; extra expirations are missed deadlines
+                    missed_ticks += timer.wait() - 1
                     
                     # Check if duration limit reached
-                    current_time = time.time()
+                    current_time = time.monotonic()
                     elapsed_seconds = current_time - start_time
                     
                     if args.duration > 0 and elapsed_seconds >= args.duration:
                         print(f"Reached specified duration of {args.duration} seconds.")
                         break
                     
-                    # Read current energy values
-                    current_energy = rapl_reader.read_energy_values()
-                    
-                    # Calculate power for each domain
-                    row = {
-                        'timestamp': datetime.datetime.now().isoformat(),
-                        'elapsed_seconds': round(elapsed_seconds, 6)  # Microsecond precision
-                    }
-                    
-                    for domain in domains:
-                        if prev_energy[domain] is not None and current_energy[domain] is not None:
-                            # Handle energy counter wraparound
-                            energy_diff = current_energy[domain] - prev_energy[domain]
-                            if energy_diff < 0:
-                                max_range = rapl_reader.get_max_energy(domain)
-                                energy_diff += max_range
-                            
-                            # Calculate power in watts (energy in joules / time in seconds)
-                            # Use actual elapsed time for better accuracy with small intervals
-                            actual_interval = current_time - sample_start + args.interval
-                            power_watts = (energy_diff / 1000000) / actual_interval
-                            row[f"{domain}_power_watts"] = round(power_watts, 3)
-                        else:
-                            row[f"{domain}_power_watts"] = None
+                    # Store raw energy readings; power is computed by the writer thread
+                    rapl_reader.read_energy_into(energy_cols[idx])
+                    elapsed_col[idx] = elapsed_seconds
                     
-                    # Update previous energy values
-                    prev_energy = current_energy
-                    
-                    # Add to buffer
-                    buffer.append(row)
+                    idx += 1
                     samples += 1
                     
                     # Flush buffer when it reaches the buffer size
-                    if len(buffer) >= args.buffer_size:
-                        writer.writerows(buffer)
-                        csvfile.flush()
-                        buffer = []
+                    if idx >= buffer_rows:
+                        check_writer()
+                        writer_q.put((elapsed_col, energy_cols))
                         
-                        # Print status update
-                        current = time.time()
-                        if current - last_status_time >= 5:  # Status update every 5 seconds
-                            rate = samples / (current - start_time)
-                            total_power = sum(v for k, v in row.items() if k.endswith('_power_watts') and v is not None)
-                            print(f"[{row['timestamp']}] Collected {samples} samples ({rate:.2f} samples/sec), "
-                                  f"Total CPU Power: {round(total_power, 2)}W")
-                            last_status_time = current
-                    
-                    # Calculate sleep time to maintain requested interval
-                    sample_time = time.time() - sample_start
-                    sleep_time = max(0, args.interval - sample_time)
-                    if sleep_time > 0:
-                        time.sleep(sleep_time)
+                        # The writer thread now owns the filled buffers
+                        elapsed_col, energy_cols = new_buffers()
+                        idx = 0
                         
             except KeyboardInterrupt:
                 print("\nMonitoring stopped by user.")
+            finally:
+                timer.close()
+                # Release RAPL file descriptors on every exit path, before the CSV is closed
+                rapl_reader.close()
             
-            # Write any remaining buffer data
-            if buffer:
-                writer.writerows(buffer)
+            # Write any remaining buffer data and wait for the writer to finish
+            if idx:
+                writer_q.put((elapsed_col[:idx], energy_cols[:idx]))
+            writer_q.put(None)
+            writer_thread.join()
+            if writer_errors:
+                raise Exception(f"CSV writer thread failed: {writer_errors[0]}")
             
             # Calculate stats
-            end_time = time.time()
+            end_time = time.monotonic()
             total_time = end_time - start_time
             avg_rate = samples / total_time if total_time > 0 else 0
             
             print(f"\nMonitoring complete.")
             print(f"Collected {samples} samples over {total_time:.2f} seconds")
             print(f"Average sampling rate: {avg_rate:.2f} samples/second")
+            if missed_ticks:
+                print(f"Missed {missed_ticks} sampling deadlines")
             print(f"Data saved to {args.output}")
             
     except Exception as e:
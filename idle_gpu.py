@@ -6,9 +6,10 @@ This script monitors GPU energy consumption using NVIDIA-SMI at high frequency.
 Optimized for capturing rapid changes in power usage.
 
 Requirements:
-- Python 3.6+
+- Python 3.7+
 - NVIDIA GPU with nvidia-smi utility
 - pynvml package (pip install nvidia-ml-py3)
+- Linux timerfd support (used to pace sampling)
 """
 
 import os
@@ -16,9 +17,13 @@ import time
 import datetime
 import argparse
 import csv
+import queue
 import subprocess
+import threading
 from pathlib import Path
 
+from sampling import IntervalTimer, PollTimer, configure_sampler_scheduling
+
 try:
     import pynvml
     PYNVML_AVAILABLE = True
@@ -126,6 +131,12 @@ def main():
                         help="Buffer size before writing to disk (default: 1000 samples)")
     parser.add_argument("--minimal", action="store_true",
                         help="Collect only power data for maximum sampling speed")
+    parser.add_argument("--poll", action="store_true",
+                        help="Busy-wait between samples for sub-millisecond precision (uses 100%% of one CPU core)")
+    parser.add_argument("--cpu", type=int,
+                        help="Pin the sampling thread to this CPU")
+    parser.add_argument("--rt-prio", type=int,
+                        help="Run the sampling thread under SCHED_FIFO at this priority (1-99) and lock memory")
     args = parser.parse_args()
     
     # Check if nvidia-smi is available
@@ -141,6 +152,10 @@ def main():
         print("Warning: Sampling interval is extremely small. This may impact system performance.")
         print("The actual interval may be limited by hardware and API capabilities.")
     
+    if args.poll:
+        print("Warning: --poll busy-waits between samples and keeps one CPU core at 100% utilization.")
+        print("Consider combining it with --cpu to dedicate a core to sampling.")
+    
     try:
         # Initialize NVML and get GPU information
         gpus = get_gpu_info_nvml()
@@ -152,21 +167,28 @@ def main():
         with open(args.output, 'w', newline='') as csvfile:
             fieldnames = ['timestamp', 'elapsed_seconds']
             
-            # Add fields for each GPU
+            # Add fields for each GPU; the keys are static, so build them once
+            gpu_keys = []
             for gpu in gpus:
                 prefix = f"gpu{gpu['index']}"
-                fieldnames.append(f"{prefix}_power_watts")
+                keys = {'power': f"{prefix}_power_watts"}
                 
                 # Add additional fields unless in minimal mode
                 if not args.minimal:
-                    fieldnames.extend([
-                        f"{prefix}_temperature_c",
-                        f"{prefix}_utilization_gpu_percent",
-                        f"{prefix}_utilization_memory_percent",
-                        f"{prefix}_sm_clock_mhz",
-                        f"{prefix}_mem_clock_mhz",
-                        f"{prefix}_memory_used_mb"
-                    ])
+                    keys.update({
+                        'temperature': f"{prefix}_temperature_c",
+                        'util_gpu': f"{prefix}_utilization_gpu_percent",
+                        'util_memory': f"{prefix}_utilization_memory_percent",
+                        'sm_clock': f"{prefix}_sm_clock_mhz",
+                        'mem_clock': f"{prefix}_mem_clock_mhz",
+                        'memory_used': f"{prefix}_memory_used_mb"
+                    })
+                
+                gpu_keys.append(keys)
+                fieldnames.extend(keys.values())
+            
+            # Each sample starts from a copy of this preallocated row
+            row_template = dict.fromkeys(fieldnames)
             
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
@@ -174,20 +196,66 @@ def main():
             # Create buffer for samples to reduce disk I/O
             buffer = []
             
-            start_time = time.time()
+            # Full buffers are written by a background thread, off the sampling path
+            writer_q = queue.SimpleQueue()
+            writer_errors = []
+            
+            def check_writer():
+                """Abort monitoring if the writer thread has stopped."""
+                if not writer_thread.is_alive():
+                    reason = writer_errors[0] if writer_errors else "unknown error"
+                    raise Exception(f"CSV writer thread stopped ({reason}); aborting monitoring.")
+            
+            def drain():
+                try:
+                    while True:
+                        rows = writer_q.get()
+                        if rows is None:
+                            break
+                        # Derive wall-clock timestamps from the monotonic offsets
+                        for row in rows:
+                            row['timestamp'] = (anchor_dt + datetime.timedelta(seconds=row['elapsed_seconds'])).isoformat()
+                        writer.writerows(rows)
+                        csvfile.flush()
+                except Exception as e:
+                    # Reported by the sampling loop, which then stops the run
+                    writer_errors.append(e)
+            
+            writer_thread = threading.Thread(target=drain, daemon=True)
+            writer_thread.start()
+            
+            start_time = time.monotonic()
+            anchor_dt = datetime.datetime.now()
             print(f"Starting high-frequency GPU monitoring at {args.interval}s intervals...")
             print(f"Data will be saved to {args.output}")
             print("Press Ctrl+C to stop monitoring")
             
+            # Applies to this (sampling) thread only; the writer thread keeps default scheduling
+            configure_sampler_scheduling(args.cpu, args.rt_prio)
+            
+            # Memory usage and clocks change slowly; query them about once per second
+            slow_stride = max(1, int(1.0 / args.interval))
+            last_clocks = [None] * len(gpus)
+            last_memory = [None] * len(gpus)
+            
+            # Bind per-GPU attributes and NVML helpers to locals for the hot loop
+            gpu_samplers = [(i, gpu['handle'], keys)
+                            for i, (gpu, keys) in enumerate(zip(gpus, gpu_keys))]
+            minimal = args.minimal
+            get_power = get_gpu_power_nvml
+            get_temperature = get_gpu_temperature_nvml
+            get_utilization = get_gpu_utilization_nvml
+            get_clocks = get_clock_info_nvml
+            get_memory = get_gpu_memory_nvml
+            
+            timer = PollTimer(args.interval) if args.poll else IntervalTimer(args.interval)
             try:
                 samples = 0
+                missed_ticks = 0
                 last_status_time = start_time
                 
                 while True:
-                    sample_start = time.time()
-                    
-                    # Initialize row with timestamp
-                    current_time = time.time()
+                    current_time = time.monotonic()
                     elapsed_seconds = current_time - start_time
                     
                     # Check if duration limit reached
@@ -195,32 +263,34 @@ def main():
                         print(f"Reached specified duration of {args.duration} seconds.")
                         break
                     
-                    row = {
-                        'timestamp': datetime.datetime.now().isoformat(),
-                        'elapsed_seconds': round(elapsed_seconds, 6)  # Microsecond precision
-                    }
+                    # Timestamps are filled in by the writer thread
+                    row = row_template.copy()
+                    row['elapsed_seconds'] = round(elapsed_seconds, 6)  # Microsecond precision
+                    
+                    refresh_slow = samples % slow_stride == 0
                     
                     # Get stats for each GPU
-                    for gpu in gpus:
-                        prefix = f"gpu{gpu['index']}"
-                        
+                    for i, handle, keys in gpu_samplers:
                         # Always get power consumption
-                        power = get_gpu_power_nvml(gpu['handle'])
-                        row[f"{prefix}_power_watts"] = round(power, 3) if power is not None else None
+                        power = get_power(handle)
+                        row[keys['power']] = round(power, 3) if power is not None else None
                         
                         # Get additional metrics unless in minimal mode
-                        if not args.minimal:
-                            temp = get_gpu_temperature_nvml(gpu['handle'])
-                            util = get_gpu_utilization_nvml(gpu['handle'])
-                            clocks = get_clock_info_nvml(gpu['handle'])
-                            memory = get_gpu_memory_nvml(gpu['handle'])
+                        if not minimal:
+                            temp = get_temperature(handle)
+                            util = get_utilization(handle)
+                            if refresh_slow:
+                                last_clocks[i] = get_clocks(handle)
+                                last_memory[i] = get_memory(handle)
+                            clocks = last_clocks[i]
+                            memory = last_memory[i]
                             
-                            row[f"{prefix}_temperature_c"] = temp
-                            row[f"{prefix}_utilization_gpu_percent"] = util['gpu']
-                            row[f"{prefix}_utilization_memory_percent"] = util['memory']
-                            row[f"{prefix}_sm_clock_mhz"] = clocks['sm_clock']
-                            row[f"{prefix}_mem_clock_mhz"] = clocks['mem_clock']
-                            row[f"{prefix}_memory_used_mb"] = round(memory['used'], 2) if memory['used'] is not None else None
+                            row[keys['temperature']] = temp
+                            row[keys['util_gpu']] = util['gpu']
+                            row[keys['util_memory']] = util['memory']
+                            row[keys['sm_clock']] = clocks['sm_clock']
+                            row[keys['mem_clock']] = clocks['mem_clock']
+                            row[keys['memory_used']] = round(memory['used'], 2) if memory['used'] is not None else None
                     
                     # Add to buffer
                     buffer.append(row)
@@ -228,38 +298,44 @@ def main():
                     
                     # Flush buffer when it reaches the buffer size
                     if len(buffer) >= args.buffer_size:
-                        writer.writerows(buffer)
-                        csvfile.flush()
+                        check_writer()
+                        writer_q.put(buffer)
                         buffer = []
                         
                         # Print status update
-                        current = time.time()
+                        current = time.monotonic()
                         if current - last_status_time >= 5:  # Status update every 5 seconds
                             rate = samples / (current - start_time)
-                            print(f"[{row['timestamp']}] Collected {samples} samples ({rate:.2f} samples/sec)")
+                            timestamp = anchor_dt + datetime.timedelta(seconds=elapsed_seconds)
+                            print(f"[{timestamp.isoformat()}] Collected {samples} samples ({rate:.2f} samples/sec)")
                             last_status_time = current
                     
-                    # Calculate sleep time to maintain requested interval
-                    sample_time = time.time() - sample_start
-                    sleep_time = max(0, args.interval - sample_time)
-                    if sleep_time > 0:
-                        time.sleep(sleep_time)
+                    # Block until the next tick; extra expirations are missed deadlines
+                    missed_ticks += timer.wait() - 1
                         
             except KeyboardInterrupt:
                 print("\nMonitoring stopped by user.")
+            finally:
+                timer.close()
             
-            # Write any remaining buffer data
+            # Write any remaining buffer data and wait for the writer to finish
             if buffer:
-                writer.writerows(buffer)
+                writer_q.put(buffer)
+            writer_q.put(None)
+            writer_thread.join()
+            if writer_errors:
+                raise Exception(f"CSV writer thread failed: {writer_errors[0]}")
             
             # Calculate stats
-            end_time = time.time()
+            end_time = time.monotonic()
             total_time = end_time - start_time
             avg_rate = samples / total_time if total_time > 0 else 0
             
             print(f"\nMonitoring complete.")
             print(f"Collected {samples} samples over {total_time:.2f} seconds")
             print(f"Average sampling rate: {avg_rate:.2f} samples/second")
+            if missed_ticks:
+                print(f"Missed {missed_ticks} sampling deadlines")
             print(f"Data saved to {args.output}")
             
             # Clean up NVML
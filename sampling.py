@@ -0,0 +1,115 @@
+"""
+Sampling Helpers Shared by the High-Frequency Monitors
+------------------------------------------------------
+Pacing timers and sampling-thread scheduling used by idle_cpu.py and idle_gpu.py.
+
+Requirements:
+- Python 3.7+
+- Linux (timerfd, sched_setaffinity, SCHED_FIFO, mlockall)
+"""
+
+import os
+import time
+import ctypes
+import struct
+
+# timerfd constants from <sys/timerfd.h>
+CLOCK_MONOTONIC = 1
+TFD_CLOEXEC = 0o2000000
+
+# mlockall flags from <sys/mman.h>
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+# Native-endian u64 as returned by timerfd and perf event counter reads
+U64 = struct.Struct("Q")
+
+class Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+class Itimerspec(ctypes.Structure):
+    _fields_ = [("it_interval", Timespec), ("it_value", Timespec)]
+
+class IntervalTimer:
+    """Periodic CLOCK_MONOTONIC timerfd that paces sampling on an absolute schedule."""
+    
+    def __init__(self, interval):
+        """Arm a timer firing every `interval` seconds, starting one interval from now."""
+        interval_ns = int(round(interval * 1e9))
+        if interval_ns <= 0:
+            raise ValueError("Sampling interval must be positive.")
+        
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC)
+        self.buf = bytearray(U64.size)  # reused for every expiration count read
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"timerfd_create failed: {os.strerror(errno)}")
+        
+        period = Timespec(interval_ns // 1000000000, interval_ns % 1000000000)
+        spec = Itimerspec(period, period)
+        if libc.timerfd_settime(self.fd, 0, ctypes.byref(spec), None) < 0:
+            errno = ctypes.get_errno()
+            self.close()
+            raise OSError(errno, f"timerfd_settime failed: {os.strerror(errno)}")
+    
+    def wait(self):
+        """Block until the next tick; return the number of expirations (>1 means missed ticks)."""
+        os.readv(self.fd, (self.buf,))
+        return U64.unpack_from(self.buf)[0]
+    
+    def close(self):
+        """Disarm and close the timer."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollTimer:
+    """Busy-polling alternative to IntervalTimer for sub-millisecond cadence.
+    
+    Spins on time.monotonic_ns() between samples, keeping one CPU core fully busy.
+    """
+    
+    def __init__(self, interval):
+        """Schedule the first deadline one interval from now."""
+        self.interval_ns = int(round(interval * 1e9))
+        if self.interval_ns <= 0:
+            raise ValueError("Sampling interval must be positive.")
+        self.next_deadline = time.monotonic_ns() + self.interval_ns
+    
+    def wait(self):
+        """Spin until the next deadline; return the number of elapsed deadlines (>1 means missed ticks)."""
+        now = time.monotonic_ns()
+        while now < self.next_deadline:
+            now = time.monotonic_ns()
+        expirations = (now - self.next_deadline) // self.interval_ns + 1
+        self.next_deadline += expirations * self.interval_ns
+        return expirations
+    
+    def close(self):
+        """Nothing to release; provided for parity with IntervalTimer."""
+
+def configure_sampler_scheduling(cpu=None, rt_prio=None):
+    """Pin the calling thread to a CPU and/or run it under SCHED_FIFO with memory locked.
+    
+    Failures (e.g. missing privileges) are reported and monitoring continues
+    with the default scheduling.
+    """
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+            print(f"Sampling thread pinned to CPU {cpu}")
+        except OSError as e:
+            print(f"Warning: Couldn't pin sampling thread to CPU {cpu}: {e}")
+    
+    if rt_prio is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_prio))
+            print(f"Sampling thread running with SCHED_FIFO priority {rt_prio}")
+        except OSError as e:
+            print(f"Warning: Couldn't set SCHED_FIFO priority {rt_prio}: {e}")
+        
+        # Avoid page-fault stalls in the sampling loop
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            print(f"Warning: Couldn't lock process memory: {os.strerror(ctypes.get_errno())}")
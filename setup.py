@@ -0,0 +1,14 @@
+"""
+Build script for the optional _rapl_fast C extension used by idle_cpu.py.
+
+    python setup.py build_ext --inplace
+
+idle_cpu.py falls back to pure-Python reads when the extension is not built.
+"""
+
+from setuptools import setup, Extension
+
+setup(
+    name="power-profiler-rapl-fast",
+    ext_modules=[Extension("_rapl_fast", sources=["_rapl_fast.c"])],
+)